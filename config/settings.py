@@ -1,6 +1,10 @@
+from datetime import datetime
+
 from decouple import config
 
 openfigi_tokens_cast = lambda x: x.replace(" ", "").split(",")
+list_cast = lambda x: [v.strip() for v in x.split(",") if v.strip()]
+datetime_cast = lambda x: datetime.fromisoformat(x) if x else None
 
 
 LOG_LEVEL = config("LOG_LEVEL", default="INFO")
@@ -15,13 +19,75 @@ CURRENCIES_QUERY = config("CURRENCIES_QUERY")
 ALL_EXCHANGES_QUERY = config("ALL_EXCHANGES_QUERY")
 EXCHANGES_PRIORITY_QUERY = config("EXCHANGES_PRIORITY_QUERY")
 EXCHANGES_COMP_PRIORITY_QUERY = config("EXCHANGES_COMP_PRIORITY_QUERY")
+ISHARES_CHANGED_SINCE = config(
+    "ISHARES_CHANGED_SINCE", cast=datetime_cast, default=""
+)
+ISHARES_PUSHDOWN_COLUMNS = config(
+    "ISHARES_PUSHDOWN_COLUMNS",
+    cast=list_cast,
+    default="isin,ishares_name,exchange_ticker,ishares_exchange_name,cusip,sedol,wkn,valor",  # noqa: E501
+)
+EOD_TICKERS_TICKER_COLUMN = config("EOD_TICKERS_TICKER_COLUMN", default="ticker")
 OPENFIGI_TOKENS = config("OPENFIGI_TOKENS", cast=openfigi_tokens_cast)
 OPENFIGI_THREAD_COUNT = config("OPENFIGI_THREAD_COUNT", cast=int, default=5)
 OPENFIGI_MAX_RETRIES = config("OPENFIGI_MAX_RETRIES", cast=int, default=3)
 OPENFIGI_BACKOFF_FACTOR = config("OPENFIGI_BACKOFF_FACTOR", cast=int, default=2)
+OPENFIGI_REQUEST_TIMEOUT = config("OPENFIGI_REQUEST_TIMEOUT", cast=int, default=60)
+BRIGHTDATA_POOL_SIZE = config(
+    "BRIGHTDATA_POOL_SIZE", cast=int, default=OPENFIGI_THREAD_COUNT * 2
+)
+BRIGHTDATA_SESSION_MAX_LATENCY = config(
+    "BRIGHTDATA_SESSION_MAX_LATENCY", cast=float, default=15.0
+)
+BRIGHTDATA_SESSION_MAX_ERROR_RATE = config(
+    "BRIGHTDATA_SESSION_MAX_ERROR_RATE", cast=float, default=0.5
+)
+BRIGHTDATA_SESSION_MIN_REQUESTS = config(
+    "BRIGHTDATA_SESSION_MIN_REQUESTS", cast=int, default=3
+)
+MAPPING_DEADLINE_SECONDS = config("MAPPING_DEADLINE_SECONDS", cast=int, default=0)
+MAPPING_PRIORITY = config("MAPPING_PRIORITY", cast=list_cast, default="")
+MAPPING_PRIORITY_EXCHANGES = config(
+    "MAPPING_PRIORITY_EXCHANGES", cast=list_cast, default=""
+)
+MAPPING_PRIORITY_WEIGHT_COLUMN = config(
+    "MAPPING_PRIORITY_WEIGHT_COLUMN", default="weight"
+)
+TICKER_PROCESS_COUNT = config("TICKER_PROCESS_COUNT", cast=int, default=1)
+TICKER_CHUNK_SIZE = config("TICKER_CHUNK_SIZE", cast=int, default=5000)
+MAPPING_ARCHIVE_MODE = config("MAPPING_ARCHIVE_MODE", default="off")
+MAPPING_ARCHIVE_PATH = config(
+    "MAPPING_ARCHIVE_PATH", default="archive/openfigi-mapping.parquet"
+)
+RUN_MODE = config("RUN_MODE", default="full")
+SHARD_COUNT = config("SHARD_COUNT", cast=int, default=1)
+SHARD_INDEX = config(
+    "SHARD_INDEX",
+    cast=int,
+    default=config("JOB_COMPLETION_INDEX", cast=int, default=0),
+)
+SHARD_RUN_ID = config("SHARD_RUN_ID", default="")
+SHARD_STAGING_DIR = config("SHARD_STAGING_DIR", default="staging")
+SERVICE_HOST = config("SERVICE_HOST", default="0.0.0.0")
+SERVICE_PORT = config("SERVICE_PORT", cast=int, default=8080)
+SERVICE_REFRESH_INTERVAL = config("SERVICE_REFRESH_INTERVAL", cast=int, default=3600)
+LOOKUP_CACHE_TTL = config("LOOKUP_CACHE_TTL", cast=int, default=86400)
+LOOKUP_CACHE_SIZE = config("LOOKUP_CACHE_SIZE", cast=int, default=100000)
+PROFILING_ENABLED = config("PROFILING_ENABLED", cast=bool, default=False)
+PROFILING_DIR = config("PROFILING_DIR", default="profiles")
+PROFILING_TOP_N = config("PROFILING_TOP_N", cast=int, default=25)
+PROFILING_TRACEBACK_DEPTH = config("PROFILING_TRACEBACK_DEPTH", cast=int, default=1)
 MSSQL_AD_LOGIN = config("MSSQL_AD_LOGIN", cast=bool, default=False)
 MSSQL_SERVER = config("MSSQL_SERVER")
 MSSQL_DATABASE = config("MSSQL_DATABASE")
+MSSQL_QUERY_PUSHDOWN = config("MSSQL_QUERY_PUSHDOWN", cast=bool, default=False)
+MSSQL_FETCH_SIZE = config("MSSQL_FETCH_SIZE", cast=int, default=50000)
+MSSQL_BULK_LOAD = config("MSSQL_BULK_LOAD", cast=bool, default=False)
+MSSQL_BULK_CHUNK_SIZE = config("MSSQL_BULK_CHUNK_SIZE", cast=int, default=10000)
+MSSQL_BULK_WORKERS = config("MSSQL_BULK_WORKERS", cast=int, default=4)
+MSSQL_MIGRATE_OUTPUT_SCHEMA = config(
+    "MSSQL_MIGRATE_OUTPUT_SCHEMA", cast=bool, default=False
+)
 
 if not MSSQL_AD_LOGIN:
     MSSQL_USERNAME = config("MSSQL_USERNAME")
@@ -1 +1 @@
-from .mssql import MSSQLDatabase  # noqa: F401
+from .mssql import MSSQLDatabase, param_chunks  # noqa: F401
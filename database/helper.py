@@ -1,15 +1,24 @@
+import pandas as pd
+
 from config import logger, settings
-from database import MSSQLDatabase
+from database import MSSQLDatabase, param_chunks
+from database.queries import build_eod_tickers_query, build_ishares_query
 
 
 def init_db_instance():
     return MSSQLDatabase()
 
 
-def get_ishares():
+def get_ishares(exchanges=None, changed_since=None):
     conn = init_db_instance()
+    if settings.MSSQL_QUERY_PUSHDOWN:
+        query, params = build_ishares_query(exchanges, changed_since)
+        return conn.select_table(query, params)
+
     query = settings.ISHARES_QUERY
     table = conn.select_table(query)
+    if changed_since is not None:
+        table = table[table["timestamp_created_utc"] >= changed_since]
     table.drop(columns=["timestamp_created_utc", "rn"], inplace=True)
     return table
 
@@ -21,8 +30,7 @@ def get_exchanges_priority(comp=False):
     else:
         query = settings.EXCHANGES_PRIORITY_QUERY
 
-    table = conn.select_table(query)
-    records = [list(data.values()) for data in table.to_dict("records")]
+    records = [list(row) for rows in conn.select_chunks(query) for row in rows]
     return records
 
 
@@ -30,25 +38,25 @@ def get_all_exchanges():
     conn = init_db_instance()
     query = settings.ALL_EXCHANGES_QUERY
     try:
-        table = conn.select_table(query)
         result = {}
 
-        for row in table.to_dict("records"):
-            exch_name = row["ishares_exchange_name"]
-            exch_info = {
-                "eod": row["ext2_exch"],
-                "yahoo": row["ext3_exch"],
-                "bbg_exch": row["bbg_exch"],
-                "bbg_exch_comp": row["bbg_exch_comp"],
-                "country_iso2": row["country_iso2"],
-                "ext2_exch_comp": row["ext2_exch_comp"],
-                "ext3_exch_comp": row["ext3_exch_comp"],
-            }
+        for rows in conn.select_chunks(query):
+            for row in rows:
+                exch_name = row.ishares_exchange_name
+                exch_info = {
+                    "eod": row.ext2_exch,
+                    "yahoo": row.ext3_exch,
+                    "bbg_exch": row.bbg_exch,
+                    "bbg_exch_comp": row.bbg_exch_comp,
+                    "country_iso2": row.country_iso2,
+                    "ext2_exch_comp": row.ext2_exch_comp,
+                    "ext3_exch_comp": row.ext3_exch_comp,
+                }
 
-            if exch_name not in result:
-                result[exch_name] = []
+                if exch_name not in result:
+                    result[exch_name] = []
 
-            result[exch_name].append(exch_info)
+                result[exch_name].append(exch_info)
 
         return result
 
@@ -60,25 +68,55 @@ def get_all_exchanges():
 def get_currencies():
     conn = init_db_instance()
     query = settings.CURRENCIES_QUERY
-    table = conn.select_table(query)
-    records = {
-        list(data.values())[0]: list(data.values())[1]
-        for data in table.to_dict("records")
-    }
+    records = {}
+    for rows in conn.select_chunks(query):
+        for row in rows:
+            records[row[0]] = row[1]
     return records
 
 
-def get_eod_tickers():
+def get_eod_tickers(exchange_codes=None):
     conn = init_db_instance()
-    query = settings.EOD_TICKERS_QUERY
-    table = conn.select_table(query)
-    tickers = list(table.to_dict("list").values())[1]
+    if settings.MSSQL_QUERY_PUSHDOWN:
+        query, params = build_eod_tickers_query(exchange_codes)
+    else:
+        query, params = settings.EOD_TICKERS_QUERY, None
+    tickers = set()
     isin_ticker_map = {}
-    for record in table.to_dict("records"):
-        isin, ticker = list(record.values())
-        if isin not in isin_ticker_map:
-            isin_ticker_map[isin] = []
+    for rows in conn.select_chunks(query, params=params):
+        for isin, ticker in rows:
+            tickers.add(ticker)
+            if isin not in isin_ticker_map:
+                isin_ticker_map[isin] = []
 
-        isin_ticker_map[isin].append(ticker)
+            isin_ticker_map[isin].append(ticker)
 
     return tickers, isin_ticker_map
+
+
+def get_previous_isins():
+    conn = init_db_instance()
+    query = f"SELECT DISTINCT isin FROM {settings.OUTPUT_TABLE}"
+    try:
+        return {row[0] for rows in conn.select_chunks(query) for row in rows}
+    except Exception as e:
+        logger.error(f"Failed to fetch previously mapped ISINs: {e}")
+        return set()
+
+
+def get_previous_output(isins):
+    conn = init_db_instance()
+    object_id = conn.select_table(
+        "SELECT OBJECT_ID(?, 'U') AS object_id", [settings.OUTPUT_TABLE]
+    )
+    if pd.isna(object_id["object_id"].iloc[0]):
+        logger.info(f"{settings.OUTPUT_TABLE} does not exist yet, nothing to carry")
+        return None
+
+    tables = []
+    for chunk, placeholders in param_chunks(sorted(isins)):
+        query = (
+            f"SELECT * FROM {settings.OUTPUT_TABLE} WHERE [isin] IN ({placeholders})"
+        )
+        tables.append(conn.select_table(query, chunk))
+    return pd.concat(tables, ignore_index=True) if tables else None
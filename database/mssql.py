@@ -1,5 +1,9 @@
+import math
 import struct
+import threading
+import time
 import warnings
+from concurrent.futures import ThreadPoolExecutor
 
 import pandas as pd
 import pyodbc
@@ -10,6 +14,44 @@ from config import logger, settings
 
 warnings.filterwarnings("ignore")
 
+OUTPUT_SCHEMA = {
+    "exchange_ticker": "varchar(32)",
+    "ishares_name": "nvarchar(200)",
+    "isin": "varchar(16)",
+    "ishares_exchange_name": "nvarchar(100)",
+    "currency": "varchar(3)",
+    "cusip": "varchar(16)",
+    "sedol": "varchar(16)",
+    "bbg_figi": "varchar(12)",
+    "bbg_name": "nvarchar(200)",
+    "bbg_compositefigi": "varchar(12)",
+    "bbg_securitytype": "varchar(50)",
+    "bbg_marketsector": "varchar(20)",
+    "bbg_securitytype2": "varchar(50)",
+    "bbg_securitydescription": "nvarchar(200)",
+    "bbg_shareclassfigi": "varchar(12)",
+    "ext2_ticker": "varchar(50)",
+    "ext3_ticker": "varchar(50)",
+    "bbg_ticker": "varchar(50)",
+    "bbg_comp_ticker": "varchar(50)",
+    "ext2_comp_ticker": "varchar(50)",
+    "ext3_comp_ticker": "varchar(50)",
+    "bbg_exch": "varchar(16)",
+    "bbg_exch_comp": "varchar(16)",
+    "country_iso2": "varchar(4)",
+    "wkn": "varchar(16)",
+    "valor": "varchar(16)",
+    "timestamp_created_utc": "datetime2",
+}
+
+
+def param_chunks(values, size=2000):
+    # SQL Server caps a statement at 2100 parameters
+    values = list(values)
+    for start in range(0, len(values), size):
+        chunk = values[start: start + size]
+        yield chunk, ", ".join("?" for _ in chunk)
+
 
 def pyodbc_attrs(access_token: str) -> dict:
     SQL_COPT_SS_ACCESS_TOKEN = 1256
@@ -24,6 +66,14 @@ class MSSQLDatabase(object):
     AD_LOGIN = settings.MSSQL_AD_LOGIN
     SERVER = settings.MSSQL_SERVER
     DATABASE = settings.MSSQL_DATABASE
+    BULK_CHUNK_SIZE = settings.MSSQL_BULK_CHUNK_SIZE
+    BULK_WORKERS = settings.MSSQL_BULK_WORKERS
+    MIGRATE_SCHEMA = settings.MSSQL_MIGRATE_OUTPUT_SCHEMA
+    FETCH_SIZE = settings.MSSQL_FETCH_SIZE
+    TOKEN_REFRESH_MARGIN = 300
+    _credential = None
+    _access_token = None
+    _token_lock = threading.Lock()
     if not AD_LOGIN:
         USERNAME = settings.MSSQL_USERNAME
         PASSWORD = settings.MSSQL_PASSWORD
@@ -37,14 +87,14 @@ class MSSQLDatabase(object):
                 f"UID={self.USERNAME};PWD={self.PASSWORD}"
             )
         else:
-            token = self.fecth_token()
-            self.cnx_kwargs["attrs_before"] = pyodbc_attrs(token)
             self.cnx_str = (
                 "DRIVER={ODBC Driver 18 for SQL Server};"
                 f"SERVER={self.SERVER};DATABASE={self.DATABASE};Encrypt=yes"
             )
 
     def _get_connection(self):
+        if self.AD_LOGIN:
+            self.cnx_kwargs["attrs_before"] = pyodbc_attrs(self.fecth_token())
         return pyodbc.connect(self.cnx_str, **self.cnx_kwargs)
 
     def reopen_connection(self):
@@ -56,11 +106,11 @@ class MSSQLDatabase(object):
 
         self.cnx = self._get_connection()
 
-    def select_table(self, query):
+    def select_table(self, query, params=None):
         self.reopen_connection()
         logger.info(query)
         try:
-            df = pd.read_sql(query, self.cnx)
+            df = pd.read_sql(query, self.cnx, params=params)
             logger.debug(f"Selected {len(df)} rows")
             return df
         except Exception as e:
@@ -69,10 +119,53 @@ class MSSQLDatabase(object):
         finally:
             self.cnx.close()
 
+    def select_chunks(self, query, chunk_size=None, params=None):
+        chunk_size = chunk_size or self.FETCH_SIZE
+        logger.info(query)
+        cnx = self._get_connection()
+        try:
+            cursor = cnx.cursor()
+            cursor.execute(query, *(params or []))
+            selected = 0
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+
+                selected += len(rows)
+                yield rows
+
+            logger.debug(f"Streamed {selected} rows")
+        except Exception as e:
+            logger.error(f"Error executing SELECT query: {e}")
+            raise
+        finally:
+            cnx.close()
+
+    def delete_records(self, table_name, column, values):
+        values = list(values)
+        self.reopen_connection()
+        try:
+            cursor = self.cnx.cursor()
+            for chunk, placeholders in param_chunks(values):
+                cursor.execute(
+                    f"DELETE FROM {table_name} WHERE [{column}] IN ({placeholders})",
+                    *chunk,
+                )
+            self.cnx.commit()
+            logger.info(f"Deleted {table_name} rows for {len(values)} {column} values")
+            return True
+        except Exception as e:
+            logger.error(f"Error on deleting {table_name} rows: {e}")
+            return False
+        finally:
+            self.cnx.close()
+
     def insert_table(
         self, df, table_name, if_exists="append", delete_prev_records=True
     ):
         self.reopen_connection()
+        deleted = True
         if delete_prev_records:
             try:
                 query = f"DELETE FROM {table_name}"
@@ -80,6 +173,7 @@ class MSSQLDatabase(object):
                 cursor.execute(query)
             except Exception as e:
                 logger.error(f"Error on deleting {table_name} rows: {e}")
+                deleted = False
 
         custom = {}
 
@@ -111,13 +205,220 @@ class MSSQLDatabase(object):
             )
             logger.info(f"Inserted {len(df)} rows into {table_name} table")
             self.cnx.commit()
+            return deleted
         except Exception as e:
             logger.error(f"Error inserting into table {table_name}: {e}")
+            return False
+        finally:
+            self.cnx.close()
+
+    def bulk_insert_table(
+        self,
+        df,
+        table_name,
+        delete_prev_records=True,
+        chunk_size=None,
+        workers=None,
+    ):
+        chunk_size = chunk_size or self.BULK_CHUNK_SIZE
+        workers = workers or self.BULK_WORKERS
+        columns = df.columns.tolist()
+        staging_table = f"{table_name}_staging"
+
+        self.reopen_connection()
+        try:
+            cursor = self.cnx.cursor()
+            cursor.execute(
+                f"IF OBJECT_ID('{staging_table}', 'U') IS NOT NULL "
+                f"DROP TABLE {staging_table}"
+            )
+            target_columns = self._table_columns(cursor, table_name)
+            if target_columns:
+                self._check_output_schema(cursor, table_name, target_columns, columns)
+            else:
+                cursor.execute(
+                    self._create_table_query(
+                        table_name,
+                        [
+                            (c, OUTPUT_SCHEMA.get(c, "nvarchar(200)"), True)
+                            for c in columns
+                        ],
+                    )
+                )
+            # Staging mirrors the target column for column so it can be switched in
+            target_columns = self._table_columns(cursor, table_name)
+            cursor.execute(self._create_table_query(staging_table, target_columns))
+            self.cnx.commit()
+        except Exception as e:
+            logger.error(f"Error preparing staging table {staging_table}: {e}")
+            self.cnx.close()
+            return False
+        self.cnx.close()
+
+        step = math.ceil(len(df) / workers) or 1
+        partitions = [df.iloc[i: i + step] for i in range(0, len(df), step)]
+        logger.info(
+            f"Loading {len(df)} rows into {staging_table} in {len(partitions)} "
+            f"partitions of up to {chunk_size}-row chunks"
+        )
+
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                loaded = sum(
+                    executor.map(
+                        lambda part: self._load_partition(
+                            part, staging_table, chunk_size
+                        ),
+                        partitions,
+                    )
+                )
+        except Exception as e:
+            logger.error(f"Error bulk loading into {staging_table}: {e}")
+            self._drop_table(staging_table)
+            return False
+
+        column_list = ", ".join(f"[{c}]" for c in columns)
+        self.reopen_connection()
+        try:
+            cursor = self.cnx.cursor()
+            switched = delete_prev_records and self._switch_table(
+                staging_table, table_name
+            )
+            if not switched:
+                cursor = self.cnx.cursor()
+                if delete_prev_records:
+                    cursor.execute(f"DELETE FROM {table_name}")
+                cursor.execute(
+                    f"INSERT INTO {table_name} ({column_list}) "
+                    f"SELECT {column_list} FROM {staging_table}"
+                )
+            cursor.execute(f"DROP TABLE {staging_table}")
+            self.cnx.commit()
+            logger.info(f"Inserted {loaded} rows into {table_name} table")
+            return True
+        except Exception as e:
+            self.cnx.rollback()
+            logger.error(f"Error swapping {staging_table} into {table_name}: {e}")
+            return False
+        finally:
+            self.cnx.close()
+
+    def _switch_table(self, staging_table, table_name):
+        try:
+            cursor = self.cnx.cursor()
+            cursor.execute(f"TRUNCATE TABLE {table_name}")
+            cursor.execute(f"ALTER TABLE {staging_table} SWITCH TO {table_name}")
+            logger.info(f"Switched {staging_table} into {table_name}")
+            return True
+        except Exception as e:
+            self.cnx.rollback()
+            logger.warning(
+                f"Could not switch {staging_table} into {table_name}, "
+                f"copying rows instead: {e}"
+            )
+            return False
+
+    def _check_output_schema(self, cursor, table_name, target_columns, columns):
+        actual = {name: column_type for name, column_type, _ in target_columns}
+        mismatches = [
+            (c, OUTPUT_SCHEMA[c], actual.get(c))
+            for c in columns
+            if c in OUTPUT_SCHEMA and actual.get(c) != OUTPUT_SCHEMA[c]
+        ]
+        if not mismatches:
+            return
+
+        details = ", ".join(
+            f"{c} is {found or 'missing'} (expected {expected})"
+            for c, expected, found in mismatches
+        )
+        if not self.MIGRATE_SCHEMA:
+            logger.warning(
+                f"{table_name} does not match OUTPUT_SCHEMA: {details}. "
+                "Set MSSQL_MIGRATE_OUTPUT_SCHEMA=True to migrate it"
+            )
+            return
+
+        logger.info(f"Migrating {table_name} to OUTPUT_SCHEMA: {details}")
+        for c, expected, found in mismatches:
+            action = "ALTER COLUMN" if found else "ADD"
+            cursor.execute(f"ALTER TABLE {table_name} {action} [{c}] {expected} NULL")
+
+    @staticmethod
+    def _table_columns(cursor, table_name):
+        schema, _, name = table_name.rpartition(".")
+        cursor.execute(
+            "SELECT COLUMN_NAME, DATA_TYPE, CHARACTER_MAXIMUM_LENGTH, IS_NULLABLE "
+            "FROM INFORMATION_SCHEMA.COLUMNS "
+            "WHERE TABLE_SCHEMA = COALESCE(?, SCHEMA_NAME()) AND TABLE_NAME = ? "
+            "ORDER BY ORDINAL_POSITION",
+            schema.strip("[]") or None,
+            name.strip("[]"),
+        )
+        columns = []
+        for column, data_type, length, nullable in cursor.fetchall():
+            if length is not None:
+                data_type = f"{data_type}({'max' if length == -1 else length})"
+            columns.append((column, data_type, nullable == "YES"))
+        return columns
+
+    def _load_partition(self, df, table_name, chunk_size):
+        column_list = ", ".join(f"[{c}]" for c in df.columns)
+        placeholders = ", ".join("?" for _ in df.columns)
+        query = f"INSERT INTO {table_name} ({column_list}) VALUES ({placeholders})"
+
+        cnx = self._get_connection()
+        try:
+            cursor = cnx.cursor()
+            cursor.fast_executemany = True
+            loaded = 0
+            for start in range(0, len(df), chunk_size):
+                chunk = df.iloc[start: start + chunk_size]
+                rows = [
+                    tuple(None if pd.isna(value) else value for value in row)
+                    for row in chunk.itertuples(index=False, name=None)
+                ]
+                cursor.executemany(query, rows)
+                cnx.commit()
+                loaded += len(rows)
+                logger.debug(f"Loaded {loaded}/{len(df)} rows into {table_name}")
+            return loaded
+        finally:
+            cnx.close()
+
+    def _drop_table(self, table_name):
+        self.reopen_connection()
+        try:
+            cursor = self.cnx.cursor()
+            cursor.execute(
+                f"IF OBJECT_ID('{table_name}', 'U') IS NOT NULL DROP TABLE {table_name}"
+            )
+            self.cnx.commit()
+        except Exception as e:
+            logger.debug(f"Error dropping {table_name}: {e}")
         finally:
             self.cnx.close()
 
     @staticmethod
-    def fecth_token():
-        credential = DefaultAzureCredential(exclude_shared_token_cache_credential=True)
-        token = credential.get_token("https://database.windows.net/.default").token
-        return token
+    def _create_table_query(table_name, columns):
+        definitions = ", ".join(
+            f"[{name}] {column_type} {'NULL' if nullable else 'NOT NULL'}"
+            for name, column_type, nullable in columns
+        )
+        return f"CREATE TABLE {table_name} ({definitions})"
+
+    @classmethod
+    def fecth_token(cls):
+        with cls._token_lock:
+            if (
+                cls._access_token is None
+                or cls._access_token.expires_on - time.time() < cls.TOKEN_REFRESH_MARGIN
+            ):
+                if cls._credential is None:
+                    cls._credential = DefaultAzureCredential(
+                        exclude_shared_token_cache_credential=True
+                    )
+                cls._access_token = cls._credential.get_token(
+                    "https://database.windows.net/.default"
+                )
+            return cls._access_token.token
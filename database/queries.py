@@ -0,0 +1,44 @@
+from config import settings
+
+
+def build_ishares_query(exchanges=None, changed_since=None):
+    columns = list(settings.ISHARES_PUSHDOWN_COLUMNS)
+    if (
+        "weight" in settings.MAPPING_PRIORITY
+        and settings.MAPPING_PRIORITY_WEIGHT_COLUMN not in columns
+    ):
+        columns.append(settings.MAPPING_PRIORITY_WEIGHT_COLUMN)
+
+    where = []
+    params = []
+    if exchanges is not None:
+        exchanges = sorted(exchanges)
+        if exchanges:
+            placeholders = ", ".join("?" for _ in exchanges)
+            where.append(f"q.[ishares_exchange_name] IN ({placeholders})")
+            params.extend(exchanges)
+        else:
+            where.append("1 = 0")
+
+    if changed_since is not None:
+        where.append("q.[timestamp_created_utc] >= ?")
+        params.append(changed_since)
+
+    query = (
+        f"SELECT {', '.join(f'q.[{c}]' for c in columns)} "
+        f"FROM ({settings.ISHARES_QUERY}) AS q"
+    )
+    if where:
+        query += " WHERE " + " AND ".join(where)
+    return query, params
+
+
+def build_eod_tickers_query(exchange_codes=None):
+    query = f"SELECT * FROM ({settings.EOD_TICKERS_QUERY}) AS q"
+    if not exchange_codes:
+        return query, []
+
+    column = settings.EOD_TICKERS_TICKER_COLUMN
+    codes = sorted(exchange_codes)
+    query += " WHERE " + " OR ".join(f"q.[{column}] LIKE ?" for _ in codes)
+    return query, [f"%.{code}" for code in codes]
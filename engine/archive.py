@@ -0,0 +1,101 @@
+import glob
+import os
+import threading
+
+import pandas as pd
+
+from config import logger, settings
+from engine.records import RESPONSE_FIELDS, MappingResponse
+
+KEY_COLUMNS = ("idValue", "requestExchCode")
+
+
+class MappingArchive:
+
+    COMPRESSION = "zstd"
+
+    def __init__(self, mode, path):
+        self.mode = mode
+        self.path = path
+        self.lock = threading.Lock()
+        self.responses = {}
+        self.misses = 0
+        if mode == "replay":
+            self.load()
+
+    @classmethod
+    def from_settings(cls):
+        mode = settings.MAPPING_ARCHIVE_MODE
+        if mode in ("", "off"):
+            return None
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown MAPPING_ARCHIVE_MODE {mode}")
+        return cls(mode, settings.MAPPING_ARCHIVE_PATH)
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    def record(self, body, responses):
+        with self.lock:
+            for job, resp in zip(body, responses):
+                self.responses[(job["idValue"], job["exchCode"])] = resp
+
+    def replay(self, body):
+        keys = [(job["idValue"], job["exchCode"]) for job in body]
+        missing = sum(key not in self.responses for key in keys)
+        if missing:
+            with self.lock:
+                self.misses += missing
+        return [self.responses.get(key) for key in keys]
+
+    def save(self, index=None, count=None):
+        path = self.path
+        if index is not None:
+            path = self._shard_path(index, count)
+
+        with self.lock:
+            rows = [
+                {
+                    "idValue": id_value,
+                    "requestExchCode": exch_code,
+                    **({f: resp.get(f) for f in RESPONSE_FIELDS} if resp else {}),
+                }
+                for (id_value, exch_code), resp in self.responses.items()
+            ]
+
+        dataframe = pd.DataFrame(rows, columns=[*KEY_COLUMNS, *RESPONSE_FIELDS])
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        dataframe.to_parquet(tmp_path, compression=self.COMPRESSION, index=False)
+        os.replace(tmp_path, path)
+        logger.info(f"Recorded {len(rows)} OpenFIGI responses to {path}")
+        return path
+
+    def load(self):
+        paths = [self.path]
+        if not os.path.exists(self.path):
+            paths = sorted(glob.glob(self._shard_path("*", None)))
+            if not paths:
+                raise FileNotFoundError(f"No mapping archive at {self.path}")
+
+        for path in paths:
+            dataframe = pd.read_parquet(path)
+            dataframe = dataframe.astype(object).where(dataframe.notna(), None)
+            for row in dataframe.to_dict("records"):
+                key = (row.pop("idValue"), row.pop("requestExchCode"))
+                matched = {f: v for f, v in row.items() if v is not None}
+                self.responses[key] = (
+                    MappingResponse.from_dict(matched) if matched else None
+                )
+
+        logger.info(
+            f"Loaded {len(self.responses)} OpenFIGI responses "
+            f"from {len(paths)} archive file(s)"
+        )
+
+    def _shard_path(self, index, count):
+        stem, ext = os.path.splitext(self.path)
+        if index == "*":
+            return f"{stem}.shard-*{ext}"
+        return f"{stem}.shard-{index:04d}-of-{count:04d}{ext}"
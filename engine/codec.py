@@ -0,0 +1,28 @@
+import json
+
+from engine.records import MappingResponse
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+if orjson is not None:
+    dumps = orjson.dumps
+    loads = orjson.loads
+else:
+
+    def dumps(obj):
+        return json.dumps(obj, separators=(",", ":")).encode()
+
+    def loads(content):
+        return json.loads(content)
+
+
+def decode_mapping(content):
+    # Only the first candidate of each job is used, the rest is never projected
+    return [
+        MappingResponse.from_dict(item["data"][0]) if item.get("data") else None
+        for item in loads(content)
+    ]
@@ -1,69 +1,218 @@
 import pandas as pd
 
-from config import logger
+from config import logger, settings
 from database.helper import (
     get_all_exchanges,
     get_currencies,
     get_eod_tickers,
     get_exchanges_priority,
     get_ishares,
+    get_previous_isins,
 )
+from engine.archive import MappingArchive
 from engine.openfigi import OpenFIGI
+from engine.profiler import profile_stage
+from engine.proxy import ProxyPool
+from engine.scheduler import build_priority, mapping_deadline
+from engine.shard import load_shards, remove_shards, save_shard, shard_of
+from engine.tickers import ReferenceData, generate_tickers
 
 
 class Core:
 
     def __init__(self):
         logger.info("Initializing Core")
-        self.eod_exch_index = {}
-        self.load_db_data()
-
-    def run(self):
-        ofg = OpenFIGI(self.ishares, self.exchanges_priority, keep_unlisted=True)
+        with profile_stage("load_db_data"):
+            self.load_db_data()
+        self.proxy_pool = ProxyPool()
+        self.archive = MappingArchive.from_settings()
+        self.unfinished_keys = set()
+
+    def run(self, ishares=None):
+        if ishares is None:
+            ishares = self.ishares
+
+        result, result_comp, self.unfinished_keys = self.map_records(
+            ishares, priority=self.mapping_priority(), deadline=mapping_deadline()
+        )
+        self.save_archive()
+        return self.build_output(result, result_comp)
+
+    def map_records(self, ishares, priority=None, deadline=None):
+        ofg = OpenFIGI(
+            ishares,
+            self.exchanges_priority,
+            keep_unlisted=True,
+            proxy_pool=self.proxy_pool,
+            priority=priority,
+            deadline=deadline,
+            archive=self.archive,
+        )
         logger.info("Running OpenFIGI for primary exchanges")
-        result = ofg.run()
+        with profile_stage("openfigi_primary"):
+            result = ofg.run()
         logger.info(f"Received {len(result)} results from primary OpenFIGI")
 
         unmatched_records = self.get_unmatched_records(result)
         logger.info(f"Found {len(unmatched_records)} unmatched records")
 
         ofg_comp = OpenFIGI(
-            unmatched_records, self.exchanges_priority_comp, keep_unlisted=False
+            unmatched_records,
+            self.exchanges_priority_comp,
+            keep_unlisted=False,
+            proxy_pool=self.proxy_pool,
+            priority=priority,
+            deadline=deadline,
+            archive=self.archive,
         )
         logger.info("Running OpenFIGI for component exchanges")
-        result_comp = ofg_comp.run()
+        with profile_stage("openfigi_comp"):
+            result_comp = ofg_comp.run()
         logger.info(f"Received {len(result_comp)} results from component OpenFIGI")
 
-        self.result_combined = self.combine_opnefigi_results(result, result_comp)
-        logger.info(f"Combined total result count: {len(self.result_combined)}")
+        unfinished_keys = ofg.unfinished_keys() | ofg_comp.unfinished_keys()
+        return result, result_comp, unfinished_keys
+
+    def run_shard(self, index, count):
+        mask = self.ishares["isin"].map(lambda isin: shard_of(isin, count) == index)
+        ishares = self.ishares[mask]
+        logger.info(f"Shard {index + 1}/{count} holds {len(ishares)} ishares records")
+        priority = self.mapping_priority()
+        deadline = mapping_deadline()
+
+        ofg = OpenFIGI(
+            ishares,
+            self.exchanges_priority,
+            keep_unlisted=True,
+            proxy_pool=self.proxy_pool,
+            priority=priority,
+            deadline=deadline,
+            archive=self.archive,
+        )
+        logger.info("Mapping shard on primary exchanges")
+        with profile_stage("openfigi_primary"):
+            ofg.map()
 
-        self._generate_tickers()
-        logger.info("Generated tickers for combined results")
+        unmatched_records = ofg.unmatched_records()
+        logger.info(f"Found {len(unmatched_records)} unmatched records")
 
-        self._add_exchange()
-        logger.info("Added exchange data to records")
+        ofg_comp = OpenFIGI(
+            unmatched_records,
+            self.exchanges_priority_comp,
+            keep_unlisted=False,
+            proxy_pool=self.proxy_pool,
+            priority=priority,
+            deadline=deadline,
+            archive=self.archive,
+        )
+        logger.info("Mapping shard on component exchanges")
+        with profile_stage("openfigi_comp"):
+            ofg_comp.map()
+
+        self.save_archive(index, count)
+        return save_shard(
+            index,
+            count,
+            {
+                "primary": (ofg.raw_openfigi_resp, ofg.ishares_map),
+                "comp": (ofg_comp.raw_openfigi_resp, ofg_comp.ishares_map),
+                "unfinished": ofg.unfinished_keys() | ofg_comp.unfinished_keys(),
+            },
+        )
 
-        self._add_currency()
-        logger.info("Added currency data to records")
+    def run_merge(self, count):
+        ofg = OpenFIGI(
+            [],
+            self.exchanges_priority,
+            keep_unlisted=True,
+            proxy_pool=self.proxy_pool,
+        )
+        ofg_comp = OpenFIGI(
+            [],
+            self.exchanges_priority_comp,
+            keep_unlisted=False,
+            proxy_pool=self.proxy_pool,
+        )
+        self.unfinished_keys = set()
+        for passes in load_shards(count):
+            ofg.merge(*passes["primary"])
+            ofg_comp.merge(*passes["comp"])
+            self.unfinished_keys |= passes["unfinished"]
+
+        with profile_stage("openfigi_merge"):
+            result = ofg.finalize()
+            logger.info(f"Merged {len(result)} results from primary OpenFIGI")
+            result_comp = ofg_comp.finalize()
+        logger.info(f"Merged {len(result_comp)} results from component OpenFIGI")
+
+        return self.build_output(result, result_comp)
+
+    def save_archive(self, index=None, count=None):
+        if self.archive is None:
+            return
+
+        if self.archive.replaying:
+            if self.archive.misses:
+                logger.warning(
+                    f"{self.archive.misses} OpenFIGI jobs were not in the archive "
+                    "and were treated as unmatched"
+                )
+                self.archive.misses = 0
+            return
+
+        self.archive.save(index, count)
+
+    @staticmethod
+    def cleanup_shards(count):
+        remove_shards(count)
+
+    def build_output(self, result, result_comp):
+        self.result_combined = self.combine_opnefigi_results(result, result_comp)
+        logger.info(f"Combined total result count: {len(self.result_combined)}")
 
+        self.enrich(self.result_combined)
         self.dataframe = pd.DataFrame(self.result_combined)
         logger.info("Core.run() complete")
         return self.dataframe
 
+    @staticmethod
+    def mapping_priority():
+        previous_isins = None
+        if "new" in settings.MAPPING_PRIORITY:
+            previous_isins = get_previous_isins()
+            logger.debug(f"Loaded {len(previous_isins)} previously mapped ISINs")
+        return build_priority(previous_isins)
+
     def load_db_data(self):
         logger.info("Loading data from database")
-        self.ishares = get_ishares()
-        logger.debug(f"Loaded {len(self.ishares)} ishares records")
+        self.load_reference_data()
+        self.load_ishares(changed_since=settings.ISHARES_CHANGED_SINCE)
+
+    def load_ishares(self, changed_since=None):
+        self.ishares = self.fetch_ishares(changed_since)
+
+    def fetch_ishares(self, changed_since=None):
+        exchanges = [name for name, exch in self.exchanges_priority.items() if exch]
+        ishares = get_ishares(exchanges, changed_since)
+        logger.debug(f"Loaded {len(ishares)} ishares records")
+        return ishares
 
+    def load_reference_data(self):
         self.currencies = get_currencies()
         logger.debug(f"Loaded {len(self.currencies)} currency mappings")
 
-        self.eod_tickers_list, self.isin_eod_tickers_map = get_eod_tickers()
-        logger.debug(f"Loaded {len(self.eod_tickers_list)} EOD tickers")
-
         self.exchanges = get_all_exchanges()
         logger.debug(f"Loaded {len(self.exchanges)} exchange groups")
 
+        self.eod_tickers, self.isin_eod_tickers_map = get_eod_tickers(
+            self.get_eod_exchange_codes()
+        )
+        logger.debug(f"Loaded {len(self.eod_tickers)} EOD tickers")
+
+        self.reference_data = ReferenceData(
+            self.exchanges, self.eod_tickers, self.isin_eod_tickers_map
+        )
+
         self.exchanges_priority = self.get_exchanges()
         logger.debug(
             f"Built exchange priority map with {len(self.exchanges_priority)} entries"
@@ -74,15 +223,29 @@ class Core:
             f"Built complementary exchange priority map with {len(self.exchanges_priority_comp)} entries"  # noqa: E501
         )
 
-    def _add_currency(self):
+    def enrich(self, rows):
+        with profile_stage("generate_tickers"):
+            self._generate_tickers(rows)
+        logger.info("Generated tickers for combined results")
+
+        with profile_stage("add_exchange"):
+            self._add_exchange(rows)
+        logger.info("Added exchange data to records")
+
+        with profile_stage("add_currency"):
+            self._add_currency(rows)
+        logger.info("Added currency data to records")
+        return rows
+
+    def _add_currency(self, rows):
         logger.info("Adding exchange metadata to result records")
-        for row in self.result_combined:
+        for row in rows:
             ishares_exch = row["ishares_exchange_name"]
             row["Market Currency"] = self.get_currency_by_exch(ishares_exch)
 
-    def _add_exchange(self):
+    def _add_exchange(self, rows):
         logger.info("Adding exchange metadata to result records")
-        for row in self.result_combined:
+        for row in rows:
             if "exchCode" not in row:
                 return row
 
@@ -103,241 +266,18 @@ class Core:
             if row["OPENFIGI Ticker"] == row["OPENFIGI COMP Ticker"]:
                 row["bbg_exch"] = row["bbg_exch_comp"]
 
-    def _generate_tickers(self):
+    def _generate_tickers(self, rows):
         logger.info("Generating tickers for each result row")
-        for idx, row in enumerate(self.result_combined):
-            logger.debug(f"Generating tickers for row {idx}")
-            for func in [
-                self._generate_eod_ticker,
-                (self._generate_eod_ticker,),
-                self._generate_yahoo_ticker,
-                (self._generate_yahoo_ticker,),
-                self._generate_openfigi_ticker,
-            ]:
-                if isinstance(func, tuple):
-                    resp = func[0](row, comp=True)
-                else:
-                    resp = func(row)
-
-                if not resp:
-                    continue
-
-                for k, v in resp.items():
-                    if k not in row:
-                        row[k] = v
-
-    def _generate_eod_ticker(self, row, comp=False):
-        if "exchCode" not in row:
-            return None
-
-        if row["ishares_exchange_name"] not in self.exchanges:
-            return None
-
-        result = []
+        generate_tickers(rows, self.reference_data)
 
-        for exch in self.exchanges[row["ishares_exchange_name"]]:
-            if exch["bbg_exch"] in row["exchCode"]:
-                exchange = exch
-                break
-            elif exch["bbg_exch_comp"] in row["exchCode"]:
-                exchange = exch
-                break
-
-        if comp:
-            _exchcode = exchange["ext2_exch_comp"]
-        else:
-            _exchcode = exchange["eod"]
-
-        if not _exchcode:
-            return None
-
-        if "," in _exchcode:
-            _exchcode = _exchcode.replace(" ", "").split(",")
-        else:
-            _exchcode = [_exchcode]
-
-        for eod_exchcode in _exchcode:
-            ticker = str(row["exchange_ticker"])
-            securitydesc = str(row["securityDescription"])
-            if "/" in securitydesc and "." not in ticker:
-                base = __base = securitydesc
-                base = base.replace("/", "-")
-
-                for _ in [".R", ".E"]:
-                    if _ in base:
-                        base = base.replace(_, "")
-
-                base = f"{base}.{eod_exchcode}"
-                result.append(base)
-            else:
-                base = __base = ticker
-
-                if eod_exchcode == "HK":
-                    if base.isdigit():
-                        if len(base) < 4:
-                            base = "".join(["0" for _ in range(4 - len(base))]) + base
-
-                elif eod_exchcode in ["KO", "KQ", "SHG", "SHE"]:
-                    if base.isdigit():
-                        if len(base) < 6:
-                            base = "".join(["0" for _ in range(6 - len(base))]) + base
-
-                for _ in [".R", ".E"]:
-                    if _ in base:
-                        base = base.replace(_, "")
-
-                if base[-1] == ".":
-                    base = base.replace(".", "")
-                else:
-                    base = base.replace(".", "-")
-
-                base = base.replace("*", "")
-                if " " in base:
-                    base = base.replace(" ", "-")
-
-                base = f"{base}.{eod_exchcode}"
-                result.append(base)
-
-        if len(result) == 0:
-            return None
-
-        for i in result:
-            if i in self.eod_tickers_list:
-                if "." in i:
-                    exch = i.split(".")[1]
-                    self.eod_exch_index[__base] = _exchcode.index(exch)
-
-                if comp:
-                    return {"ext2_comp_ticker": i}
-                else:
-                    return {"EOD Ticker": i}
-            else:
-                tickers = self.get_eod_ticker_by_isin(
-                    row["isin"].replace(" ", "").strip()
-                )
-                if len(tickers) > 0:
-                    for _ in _exchcode:
-                        for t in tickers:
-                            if _ in t:
-                                if comp:
-                                    return {"ext2_comp_ticker": t}
-                                else:
-                                    return {"EOD Ticker": t}
-
-    def _generate_yahoo_ticker(self, row, comp=False):
-        if "exchCode" not in row:
-            return None
-
-        if row["ishares_exchange_name"] not in self.exchanges:
-            return None
-
-        for exch in self.exchanges[row["ishares_exchange_name"]]:
-            if exch["bbg_exch"] in row["exchCode"]:
-                exchange = exch
-                break
-            elif exch["bbg_exch_comp"] in row["exchCode"]:
-                exchange = exch
-                break
-
-        if comp:
-            yahoo_exchcode = exchange["ext3_exch_comp"]
-        else:
-            yahoo_exchcode = exchange["yahoo"]
-
-        if not yahoo_exchcode:
-            return None
-
-        ticker = str(row["exchange_ticker"])
-        securitydesc = str(row["securityDescription"])
-
-        if "," in yahoo_exchcode:
-            yahoo_exchcode = yahoo_exchcode.replace(" ", "").split(",")
-
-            if ticker in self.eod_exch_index:
-                indx = self.eod_exch_index[ticker]
-                yahoo_exchcode = yahoo_exchcode[indx]
-            elif securitydesc in self.eod_exch_index:
-                indx = self.eod_exch_index[securitydesc]
-                yahoo_exchcode = yahoo_exchcode[indx]
-            else:
-                yahoo_exchcode = yahoo_exchcode[0]
-
-        if "/" in securitydesc and "." not in ticker:
-            base = securitydesc
-            base = base.replace("/", "-")
-            if yahoo_exchcode != "US":
-                base = f"{base}.{yahoo_exchcode}"
-
-            if comp:
-                return {"ext3_comp_ticker": base}
-            else:
-                return {"Yahoo Ticker": base}
-        else:
-            base = ticker
-            if yahoo_exchcode == "HK":
-                if base.isdigit():
-                    if len(base) < 4:
-                        base = "".join(["0" for _ in range(4 - len(base))]) + base
-
-            elif yahoo_exchcode == "KO" or yahoo_exchcode == "SHG":
-                if base.isdigit():
-                    if len(base) < 6:
-                        base = "".join(["0" for _ in range(6 - len(base))]) + base
-
-            if base[-1] == ".":
-                base = base.replace(".", "")
-            else:
-                base = base.replace(".", "-")
-
-            base = base.replace("*", "")
-            if " " in base:
-                if base[-2] == " ":
-                    base = base.replace(" ", "-")
-                elif base[-3] == " ":
-                    base = base[:-3]
-
-            if yahoo_exchcode != "US":
-                base = f"{base}.{yahoo_exchcode}"
-
-            if comp:
-                return {"ext3_comp_ticker": base}
-            else:
-                return {"Yahoo Ticker": base}
-
-    def _generate_openfigi_ticker(self, row):
-        if "ticker" not in row:
-            return False
-
-        exch = row["exchCode"]
-        if " " in exch:
-            exch = exch.split(" ")[0]
-
-        news = row["ticker"] + ":" + exch
-        ticker = row["ticker"] + " " + exch + " " + row["marketSector"]
-        ticker_comp = ""
-
-        if row["ishares_exchange_name"] in self.exchanges:
-            for exch in self.exchanges[row["ishares_exchange_name"]]:
-                if (
-                    exch["bbg_exch"] in row["exchCode"]
-                    or exch["bbg_exch_comp"] in row["exchCode"]
-                ):
-                    ticker_comp = (
-                        row["ticker"]
-                        + " "
-                        + exch["bbg_exch_comp"]
-                        + " "
-                        + row["marketSector"]
-                    )
-
-        return {
-            "OPENFIGI News Ticker": news,
-            "OPENFIGI Ticker": ticker,
-            "OPENFIGI COMP Ticker": ticker_comp,
-        }
-
-    def get_eod_ticker_by_isin(self, isin):
-        return self.isin_eod_tickers_map.get(isin, [])
+    def get_eod_exchange_codes(self):
+        codes = set()
+        for exch_list in self.exchanges.values():
+            for exch in exch_list:
+                for value in (exch["eod"], exch["ext2_exch_comp"]):
+                    if value:
+                        codes.update(c.strip() for c in value.split(",") if c.strip())
+        return codes
 
     def get_currency_by_exch(self, ishare_exch):
         return self.currencies.get(ishare_exch, False)
@@ -345,14 +285,18 @@ class Core:
     @staticmethod
     def combine_opnefigi_results(result_a, result_b):
         result = []
+        seen = set()
         for row in result_a:
             if "figi" not in row:
                 continue
 
             result.append(row)
+            seen.add(frozenset(row.items()))
 
         for row in result_b:
-            if row not in result:
+            identity = frozenset(row.items())
+            if identity not in seen:
+                seen.add(identity)
                 result.append(row)
 
         return result
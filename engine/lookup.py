@@ -0,0 +1,137 @@
+import threading
+import time
+from collections import OrderedDict
+
+import pandas as pd
+
+from config import logger, settings
+from transformer import Transformer
+
+
+class Lookup:
+
+    CACHE_TTL = settings.LOOKUP_CACHE_TTL
+    CACHE_SIZE = settings.LOOKUP_CACHE_SIZE
+
+    def __init__(self, core):
+        self.core = core
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def lookup(self, pairs):
+        started = time.perf_counter()
+        records = self._build_records(pairs)
+        keys = list(dict.fromkeys(self._key(record) for record in records))
+
+        mapped = {}
+        missing = []
+        for record in records:
+            key = self._key(record)
+            cached = self._get_cached(key)
+            if cached is not None:
+                mapped[key] = cached
+            elif key not in mapped:
+                mapped[key] = []
+                missing.append(record)
+
+        if missing:
+            result, result_comp, _ = self.core.map_records(missing)
+            for row in self.core.combine_opnefigi_results(result, result_comp):
+                mapped[self._key(row)].append(row)
+
+            for record in missing:
+                key = self._key(record)
+                # Unmapped listings are not cached, they may appear any minute
+                if mapped[key]:
+                    self._set_cached(key, mapped[key])
+
+        rows = [dict(row) for key in keys for row in mapped[key]]
+        for row in rows:
+            if row.get("exchange_ticker") is None:
+                row["exchange_ticker"] = row.get("ticker")
+
+        self.core.enrich(rows)
+        if rows:
+            transformed = Transformer(pd.DataFrame(rows)).transform().astype(object)
+            output = transformed.where(transformed.notna(), None).to_dict("records")
+        else:
+            output = []
+
+        logger.info(
+            f"Looked up {len(keys)} listings ({len(missing)} sent to OpenFIGI) "
+            f"in {time.perf_counter() - started:.3f}s"
+        )
+        return output
+
+    def _build_records(self, pairs):
+        pairs = [self._parse_pair(pair) for pair in pairs]
+        ishares = self.core.ishares
+        known = {}
+        for record in ishares[
+            ishares["isin"].isin({pair["isin"] for pair in pairs})
+        ].to_dict("records"):
+            key = self._key(record)
+            if key not in known:
+                known[key] = record
+
+        records = []
+        for pair in pairs:
+            record = dict(
+                known.get(
+                    self._key(pair),
+                    {"ishares_name": None, "exchange_ticker": None},
+                )
+            )
+            record.update({k: v for k, v in pair.items() if v is not None})
+            records.append(record)
+
+        return records
+
+    def _get_cached(self, key):
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is None:
+                return None
+
+            expires, rows = entry
+            if expires < time.monotonic():
+                del self.cache[key]
+                return None
+
+            self.cache.move_to_end(key)
+            return rows
+
+    def _set_cached(self, key, rows):
+        with self.lock:
+            self.cache[key] = (time.monotonic() + self.CACHE_TTL, rows)
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.CACHE_SIZE:
+                self.cache.popitem(last=False)
+
+    @staticmethod
+    def _key(record):
+        return f"{record['isin']}:{record['ishares_exchange_name']}"
+
+    @staticmethod
+    def _parse_pair(pair):
+        if isinstance(pair, dict):
+            isin = pair.get("isin")
+            exchange = pair.get("ishares_exchange_name", pair.get("exchange"))
+            ticker = pair.get("exchange_ticker", pair.get("ticker"))
+            name = pair.get("ishares_name", pair.get("name"))
+        elif isinstance(pair, (list, tuple)) and 2 <= len(pair) <= 3:
+            isin, exchange = pair[0], pair[1]
+            ticker = pair[2] if len(pair) == 3 else None
+            name = None
+        else:
+            raise ValueError(f"Expected (isin, exchange[, ticker]), got {pair!r}")
+
+        if not isin or not exchange:
+            raise ValueError(f"ISIN and iShares exchange name are required: {pair!r}")
+
+        return {
+            "isin": isin,
+            "ishares_exchange_name": exchange,
+            "exchange_ticker": ticker,
+            "ishares_name": name,
+        }
@@ -3,9 +3,12 @@ import threading
 import time
 
 import pandas as pd
-import requests
 
 from config import logger, settings
+from engine import codec
+from engine.proxy import ProxyPool
+from engine.records import MappingResult, Task, intern
+from engine.scheduler import Scheduler
 
 
 class OpenFIGI:
@@ -14,28 +17,74 @@ class OpenFIGI:
     THREAD_COUNT = settings.OPENFIGI_THREAD_COUNT
     MAX_RETRIES = settings.OPENFIGI_MAX_RETRIES
     BACKOFF_FACTOR = settings.OPENFIGI_BACKOFF_FACTOR
-
-    def __init__(self, ishares, exchanges, keep_unlisted=False):
+    REQUEST_TIMEOUT = settings.OPENFIGI_REQUEST_TIMEOUT
+
+    def __init__(
+        self,
+        ishares,
+        exchanges,
+        keep_unlisted=False,
+        proxy_pool=None,
+        priority=None,
+        deadline=None,
+        archive=None,
+    ):
         self.alive = True
+        self.proxy_pool = proxy_pool or ProxyPool()
         self.keep_unlisted = keep_unlisted
         self.ishares = ishares
         self.exchanges = exchanges
+        self.priority = priority
+        self.deadline = deadline
+        self.archive = archive
+        self.scheduler = None
         self.tasks = []
-        self.batch_tasks = []
         self.ishares_map = {}
         self.raw_openfigi_resp = []
+        self.raw_openfigi_seen = set()
+        self.raw_openfigi_lock = threading.Lock()
         self.result = []
 
     def run(self):
+        self.map()
+        return self.finalize()
+
+    def map(self):
         logger.info("Starting Openfigi run")
         self._create_tasks()
         logger.debug(f"Created {len(self.tasks)} tasks for processing")
-        self.batch_tasks = self._create_batch(self.tasks, self.THREAD_COUNT)
-        logger.info(f"Split tasks into {len(self.batch_tasks)} batches")
+        self.scheduler = Scheduler(
+            ((task, self.ishares_map[task.key]) for task in self.tasks),
+            priority=self.priority,
+            deadline=self.deadline,
+        )
         self.start_threads()
         logger.info("All threads have completed")
+        if self.scheduler.expired():
+            logger.warning(
+                f"Mapping deadline reached with {len(self.unfinished_keys())} "
+                f"of {len(self.tasks)} tasks unfinished"
+            )
         self._cleanup_duplicates()
         logger.info("Duplicates cleaned up")
+
+    def merge(self, raw_openfigi_resp, ishares_map):
+        self.raw_openfigi_resp.extend(raw_openfigi_resp)
+        self.ishares_map.update(ishares_map)
+
+    def unfinished_keys(self):
+        if self.scheduler is None:
+            return set()
+        return self.scheduler.unfinished_keys()
+
+    def unmatched_records(self):
+        return [
+            self.ishares_map[item.task.key][-1]
+            for item in self.raw_openfigi_resp
+            if not item.response and item.task.key in self.ishares_map
+        ]
+
+    def finalize(self):
         self._filter_exchange_pairs()
         logger.info("Exchange pairs filtered")
         self._assemble_final()
@@ -45,25 +94,29 @@ class OpenFIGI:
 
     def start_threads(self):
         threads = []
-        for tasks in self.batch_tasks:
-            if tasks:
-                t = threading.Thread(target=self.worker, args=[tasks])
-                threads.append(t)
-                logger.debug(f"Starting thread {t.name} for batch of size {len(tasks)}")
-                t.start()
+        for _ in range(min(self.THREAD_COUNT, len(self.tasks))):
+            t = threading.Thread(target=self.worker)
+            threads.append(t)
+            logger.debug(f"Starting thread {t.name}")
+            t.start()
 
         for t in threads:
             t.join()
             logger.debug(f"Thread {t.name} has finished")
 
-    def worker(self, tasks):
-        while tasks and self.alive:
-            batch = tasks[:30]
-            tasks[:] = tasks[len(batch):]
+    def worker(self):
+        while self.alive:
+            batch = self.scheduler.next_batch(30)
+            if not batch:
+                if self.scheduler.expired():
+                    self.alive = False
+                break
+
             requests_list = self._create_request_body(batch)
             body = [x["body"] for x in requests_list]
 
             if not body:
+                self.scheduler.complete(batch)
                 continue
 
             responses = self._request_api(body)
@@ -71,32 +124,46 @@ class OpenFIGI:
                 continue
 
             for req, resp in zip(requests_list, responses):
-                entry = {
-                    "data": req["task"],
-                    "response": resp.get("data", [{}])[0] if resp.get("data") else [],
-                }
-                if entry not in self.raw_openfigi_resp:
-                    self.raw_openfigi_resp.append(entry)
+                entry = MappingResult(req["task"], resp)
+                with self.raw_openfigi_lock:
+                    if entry not in self.raw_openfigi_seen:
+                        self.raw_openfigi_seen.add(entry)
+                        self.raw_openfigi_resp.append(entry)
+
+            self.scheduler.complete(batch)
 
     def _request_api(self, body, retry=0):
+        if self.archive is not None and self.archive.replaying:
+            return self.archive.replay(body)
+
         headers = {
             "Content-Type": "application/json",
             "X-OPENFIGI-APIKEY": random.choice(settings.OPENFIGI_TOKENS),
         }
+        timeout = self.REQUEST_TIMEOUT
+        remaining = self.scheduler.remaining() if self.scheduler else None
+        if remaining is not None:
+            if not remaining:
+                logger.debug("Mapping deadline reached, skipping request")
+                return []
+            timeout = min(timeout, remaining)
+
         try:
-            proxies = {
-                "http": f"http://{settings.BRIGHTDATA_USER}-session-{random.random()}:{settings.BRIGHTDATA_PASSWD}@{settings.BRIGHTDATA_PROXY}:{settings.BRIGHTDATA_PORT}",  # noqa: E501
-                "https": f"https://{settings.BRIGHTDATA_USER}-session-{random.random()}:{settings.BRIGHTDATA_PASSWD}@{settings.BRIGHTDATA_PROXY}:{settings.BRIGHTDATA_PORT}",  # noqa: E501
-            }
             logger.debug(
                 f"Sending request to OpenFIGI with {len(body)} items, retry={retry}"
             )
-            resp = requests.post(
-                self.OPENFIGI_MAPPING_URL, headers=headers, json=body, proxies=proxies
+            resp = self.proxy_pool.post(
+                self.OPENFIGI_MAPPING_URL,
+                headers=headers,
+                data=codec.dumps(body),
+                timeout=timeout,
             )
             if resp.status_code == 200:
                 logger.debug("Received successful response from OpenFIGI API")
-                return resp.json()
+                responses = codec.decode_mapping(resp.content)
+                if self.archive is not None:
+                    self.archive.record(body, responses)
+                return responses
             else:
                 logger.warning(f"Unexpected status {resp.status_code}: {resp.text}")
             resp.raise_for_status()
@@ -104,6 +171,9 @@ class OpenFIGI:
             logger.error(f"Error requesting OpenFIGI API: {e}")
             if retry < self.MAX_RETRIES:
                 backoff = retry**self.BACKOFF_FACTOR
+                remaining = self.scheduler.remaining() if self.scheduler else None
+                if remaining is not None:
+                    backoff = min(backoff, remaining)
                 logger.info(f"Retrying after {backoff} seconds (retry {retry + 1})")
                 time.sleep(backoff)
                 return self._request_api(body, retry + 1)
@@ -123,59 +193,60 @@ class OpenFIGI:
             if not len(self.exchanges[record["ishares_exchange_name"]]):
                 continue
 
-            task = {
-                "ISIN": record["isin"],
-                "Name": record["ishares_name"],
-                "Ticker": record["exchange_ticker"],
-                "Exchange": record["ishares_exchange_name"],
-                "exch": self.exchanges[record["ishares_exchange_name"]],
-            }
+            record["ishares_exchange_name"] = intern(record["ishares_exchange_name"])
+            key = f"{record['isin']}:{record['ishares_exchange_name']}"
+            if key in self.ishares_map:
+                # Same listing held by another fund, reuse the pending job
+                self.ishares_map[key].append(record)
+                continue
+
+            task = Task(
+                record["isin"],
+                record["ishares_name"],
+                record["exchange_ticker"],
+                record["ishares_exchange_name"],
+                self.exchanges[record["ishares_exchange_name"]],
+            )
 
             self.tasks.append(task)
-            self.ishares_map[record["isin"] + ":" + record["ishares_exchange_name"]] = (
-                record
-            )
+            self.ishares_map[key] = [record]
+
+        logger.info(
+            f"Coalesced {len(ishare_records)} records into {len(self.tasks)} tasks"
+        )
 
     def _cleanup_duplicates(self):
-        filtered = []
-        for item in self.raw_openfigi_resp:
-            data = item["data"]
-            resp = item["response"]
-            conflict = any(
-                other["data"] == data and bool(other["response"]) != bool(resp)
-                for other in self.raw_openfigi_resp
-            )
-            if conflict:
-                if resp:
-                    filtered.append(item)
-            else:
-                filtered.append(item)
-        self.raw_openfigi_resp = filtered
+        matched = {item.task for item in self.raw_openfigi_resp if item.response}
+        self.raw_openfigi_resp = [
+            item
+            for item in self.raw_openfigi_resp
+            if item.response or item.task not in matched
+        ]
 
     def _filter_exchange_pairs(self):
         for irow in self.raw_openfigi_resp:
-            if not irow["response"]:
+            if not irow.response:
                 continue
 
             for zrow in self.raw_openfigi_resp:
-                if not zrow["response"]:
+                if not zrow.response:
                     continue
 
-                if irow["response"]["name"] != zrow["response"]["name"]:
+                if irow.response.get("name") != zrow.response.get("name"):
                     continue
 
-                if irow["response"]["exchCode"] == zrow["response"]["exchCode"]:
+                if irow.response.get("exchCode") == zrow.response.get("exchCode"):
                     continue
 
                 resolved_exch_code = self.resolve_exch_pair(
-                    irow["response"]["exchCode"], zrow["response"]["exchCode"]
+                    irow.response.get("exchCode"), zrow.response.get("exchCode")
                 )
                 if not resolved_exch_code:
                     continue
 
-                if resolved_exch_code == irow["response"]["exchCode"]:
+                if resolved_exch_code == irow.response.get("exchCode"):
                     key = zrow
-                elif resolved_exch_code == zrow["response"]["exchCode"]:
+                elif resolved_exch_code == zrow.response.get("exchCode"):
                     key = irow
 
                 self.raw_openfigi_resp.remove(key)
@@ -189,47 +260,34 @@ class OpenFIGI:
     def _assemble_final(self):
         logger.info("Assembling final results")
         for item in self.raw_openfigi_resp:
-            resp = item.get("response", {})
-            key = f"{item['data']['ISIN']}:{item['data']['Exchange']}"
-            original = self.ishares_map.get(key)
-            if not original:
+            resp = item.response
+            key = item.task.key
+            originals = self.ishares_map.get(key)
+            if not originals:
                 logger.error(f"Original record not found for {key}")
                 continue
 
+            # The output has no per-fund column, so a listing held by several
+            # funds yields a single row (the last fund row, as before coalescing)
+            original = originals[-1]
             if resp:
-                if resp.get("ticker") != resp.get("securityDescription"):
-                    resp["ticker"] = resp.get("securityDescription")
-                original.update(resp)
+                # The response is shared (dedup set, archive), override on the row
+                original.update(resp.items())
+                original["ticker"] = resp.get("securityDescription")
                 self.result.append(original)
             elif self.keep_unlisted:
                 self.result.append(original)
 
-    @staticmethod
-    def _create_batch(data, count):
-        logger.debug(
-            f"Creating batch from data of length {len(data)} with count {count}"
-        )
-        step = int(round(len(data) / count))
-        if not step:
-            return [data]
-
-        batches = []
-        for i in range(0, len(data), step):
-            batches.append(data[i: i + step])
-
-        logger.debug(f"Created {len(batches)} batches")
-        return batches
-
     @staticmethod
     def _create_request_body(batch):
         body = []
         for task in batch:
-            for code in task["exch"].values():
+            for code in task.exch.values():
                 body.append(
                     {
                         "body": {
                             "idType": "ID_ISIN",
-                            "idValue": task["ISIN"],
+                            "idValue": task.isin,
                             "exchCode": code,
                         },
                         "task": task,
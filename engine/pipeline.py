@@ -0,0 +1,66 @@
+import pandas as pd
+
+from config import logger, settings
+from database.helper import get_previous_output, init_db_instance
+from engine.profiler import profile_stage
+from transformer import Transformer
+
+
+def store_output(dataframe, isins=None, carry_forward=None):
+    logger.info("Transforming Data")
+    agent = Transformer(dataframe)
+    with profile_stage("transform"):
+        transformed_dataframe = agent.transform()
+    if carry_forward:
+        transformed_dataframe = carry_forward_rows(
+            transformed_dataframe, carry_forward
+        )
+    if transformed_dataframe.empty:
+        logger.warning("Transformed dataframe is empty")
+        return transformed_dataframe
+
+    logger.info(f"\n\n{transformed_dataframe}")
+    logger.info("Preparing Database Inserter")
+    conn = init_db_instance()
+    if isins is not None:
+        logger.info(f"Replacing rows of {len(isins)} ISINs in {settings.OUTPUT_TABLE}")
+        if not conn.delete_records(settings.OUTPUT_TABLE, "isin", isins):
+            raise RuntimeError(f"Replacing rows in {settings.OUTPUT_TABLE} failed")
+
+    logger.info(f"Inserting Data into {settings.OUTPUT_TABLE}")
+    with profile_stage("insert_table"):
+        if settings.MSSQL_BULK_LOAD:
+            written = conn.bulk_insert_table(
+                transformed_dataframe,
+                settings.OUTPUT_TABLE,
+                delete_prev_records=isins is None,
+            )
+        else:
+            written = conn.insert_table(
+                transformed_dataframe,
+                settings.OUTPUT_TABLE,
+                delete_prev_records=isins is None,
+            )
+    if not written:
+        raise RuntimeError(f"Writing {settings.OUTPUT_TABLE} failed")
+    return transformed_dataframe
+
+
+def carry_forward_rows(transformed_dataframe, keys):
+    previous = get_previous_output({key.split(":", 1)[0] for key in keys})
+    if previous is None:
+        return transformed_dataframe
+
+    previous_keys = (
+        previous["isin"].astype(str)
+        + ":"
+        + previous["ishares_exchange_name"].astype(str)
+    )
+    carried = previous[previous_keys.isin(keys)].reindex(
+        columns=transformed_dataframe.columns
+    )
+    logger.info(
+        f"Carrying forward {len(carried)} previous rows "
+        f"for {len(keys)} unfinished listings"
+    )
+    return pd.concat([transformed_dataframe, carried], ignore_index=True)
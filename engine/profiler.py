@@ -0,0 +1,78 @@
+import cProfile
+import io
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+from config import logger, settings
+
+_DISABLED = nullcontext()
+# cProfile and tracemalloc are process-wide, so only one stage is profiled at a time
+_ACTIVE = threading.Lock()
+
+
+@contextmanager
+def _profile_stage(stage):
+    os.makedirs(settings.PROFILING_DIR, exist_ok=True)
+    prefix = os.path.join(
+        settings.PROFILING_DIR, f"{time.strftime('%Y%m%dT%H%M%S')}-{stage}"
+    )
+
+    owns_tracing = not tracemalloc.is_tracing()
+    if owns_tracing:
+        tracemalloc.start(settings.PROFILING_TRACEBACK_DEPTH)
+    tracemalloc.reset_peak()
+    before = tracemalloc.take_snapshot()
+
+    profiler = cProfile.Profile()
+    started = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - started
+        _, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+        if owns_tracing:
+            tracemalloc.stop()
+
+        profiler.dump_stats(f"{prefix}.prof")
+        summary = io.StringIO()
+        pstats.Stats(profiler, stream=summary).sort_stats("cumulative").print_stats(
+            settings.PROFILING_TOP_N
+        )
+        with open(f"{prefix}.cpu.txt", "w") as f:
+            f.write(summary.getvalue())
+
+        top_allocations = after.compare_to(before, "lineno")[: settings.PROFILING_TOP_N]
+        with open(f"{prefix}.alloc.txt", "w") as f:
+            f.write(f"stage={stage} elapsed={elapsed:.3f}s peak={peak} bytes\n")
+            for stat in top_allocations:
+                f.write(f"{stat}\n")
+
+        logger.info(
+            f"Profiled stage {stage}: {elapsed:.3f}s, "
+            f"peak traced memory {peak / 1024 / 1024:.1f} MiB, written to {prefix}.*"
+        )
+
+
+@contextmanager
+def _exclusive_stage(stage):
+    try:
+        with _profile_stage(stage):
+            yield
+    finally:
+        _ACTIVE.release()
+
+
+def profile_stage(stage):
+    if not settings.PROFILING_ENABLED:
+        return _DISABLED
+    if not _ACTIVE.acquire(blocking=False):
+        logger.debug(f"Not profiling stage {stage}, another stage is being profiled")
+        return _DISABLED
+    return _exclusive_stage(stage)
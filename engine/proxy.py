@@ -0,0 +1,121 @@
+import queue
+import random
+import threading
+import time
+
+import requests
+
+from config import logger, settings
+
+
+class ProxySession:
+
+    EWMA_ALPHA = 0.3
+
+    def __init__(self):
+        self.session_id = random.random()
+        self.http = requests.Session()
+        self.http.proxies = {
+            "http": f"http://{settings.BRIGHTDATA_USER}-session-{self.session_id}:{settings.BRIGHTDATA_PASSWD}@{settings.BRIGHTDATA_PROXY}:{settings.BRIGHTDATA_PORT}",  # noqa: E501
+            "https": f"https://{settings.BRIGHTDATA_USER}-session-{self.session_id}:{settings.BRIGHTDATA_PASSWD}@{settings.BRIGHTDATA_PROXY}:{settings.BRIGHTDATA_PORT}",  # noqa: E501
+        }
+        self.request_count = 0
+        self.latency = 0.0
+        self.error_rate = 0.0
+        self.in_use = False
+
+    def record(self, latency, ok):
+        self.request_count += 1
+        if self.request_count == 1:
+            self.latency = latency
+            self.error_rate = 0.0 if ok else 1.0
+            return
+
+        self.latency += self.EWMA_ALPHA * (latency - self.latency)
+        self.error_rate += self.EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+
+    @property
+    def score(self):
+        return self.latency * (1 + self.error_rate)
+
+    def is_healthy(self, max_latency, max_error_rate, min_requests):
+        if self.request_count < min_requests:
+            return True
+
+        return self.latency <= max_latency and self.error_rate <= max_error_rate
+
+    def close(self):
+        try:
+            self.http.close()
+        except Exception as e:
+            logger.debug(f"Error closing proxy session {self.session_id}: {e}")
+
+
+class ProxyPool:
+
+    SIZE = settings.BRIGHTDATA_POOL_SIZE
+    MAX_LATENCY = settings.BRIGHTDATA_SESSION_MAX_LATENCY
+    MAX_ERROR_RATE = settings.BRIGHTDATA_SESSION_MAX_ERROR_RATE
+    MIN_REQUESTS = settings.BRIGHTDATA_SESSION_MIN_REQUESTS
+
+    def __init__(self, size=None):
+        self.size = size or self.SIZE
+        self.lock = threading.Condition()
+        self.sessions = [ProxySession() for _ in range(self.size)]
+        self.retired = queue.Queue()
+        self.maintainer = threading.Thread(target=self._replace_retired, daemon=True)
+        self.maintainer.start()
+        logger.info(f"Proxy pool started with {self.size} sticky sessions")
+
+    def post(self, url, **kwargs):
+        session = self.acquire()
+        started = time.monotonic()
+        ok = False
+        try:
+            resp = session.http.post(url, **kwargs)
+            ok = resp.status_code < 500 and resp.status_code not in (403, 407)
+            return resp
+        finally:
+            self.release(session, time.monotonic() - started, ok)
+
+    def acquire(self):
+        with self.lock:
+            while True:
+                idle = [s for s in self.sessions if not s.in_use]
+                if idle:
+                    session = min(idle, key=lambda s: (s.request_count > 0, s.score))
+                    session.in_use = True
+                    return session
+
+                self.lock.wait()
+
+    def release(self, session, latency, ok):
+        with self.lock:
+            session.in_use = False
+            session.record(latency, ok)
+            if not session.is_healthy(
+                self.MAX_LATENCY, self.MAX_ERROR_RATE, self.MIN_REQUESTS
+            ):
+                logger.warning(
+                    f"Retiring proxy session {session.session_id} "
+                    f"(latency={session.latency:.2f}s, "
+                    f"error_rate={session.error_rate:.2f})"
+                )
+                self.sessions.remove(session)
+                self.retired.put(session)
+
+            self.lock.notify()
+
+    def _replace_retired(self):
+        while True:
+            session = self.retired.get()
+            session.close()
+            fresh = ProxySession()
+            with self.lock:
+                self.sessions.append(fresh)
+                self.lock.notify()
+
+            logger.debug(
+                f"Replaced proxy session {session.session_id} "
+                f"with {fresh.session_id}"
+            )
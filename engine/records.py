@@ -0,0 +1,95 @@
+import sys
+
+RESPONSE_FIELDS = (
+    "figi",
+    "name",
+    "ticker",
+    "exchCode",
+    "compositeFIGI",
+    "securityType",
+    "marketSector",
+    "shareClassFIGI",
+    "securityType2",
+    "securityDescription",
+)
+INTERNED_FIELDS = ("exchCode", "securityType", "marketSector", "securityType2")
+
+
+def intern(value):
+    if isinstance(value, str):
+        return sys.intern(value)
+    return value
+
+
+class Task:
+    __slots__ = ("isin", "name", "ticker", "exchange", "exch")
+
+    def __init__(self, isin, name, ticker, exchange, exch):
+        self.isin = isin
+        self.name = name
+        self.ticker = ticker
+        self.exchange = intern(exchange)
+        # Shared priority map of the exchange, never copied per task
+        self.exch = exch
+
+    @property
+    def key(self):
+        return f"{self.isin}:{self.exchange}"
+
+    def _identity(self):
+        return (self.isin, self.name, self.ticker, self.exchange)
+
+    def __eq__(self, other):
+        if not isinstance(other, Task):
+            return NotImplemented
+        return self._identity() == other._identity()
+
+    def __hash__(self):
+        return hash(self._identity())
+
+
+class MappingResponse:
+    __slots__ = RESPONSE_FIELDS
+
+    @classmethod
+    def from_dict(cls, data):
+        resp = cls()
+        for field in RESPONSE_FIELDS:
+            if field in data:
+                value = data[field]
+                if field in INTERNED_FIELDS:
+                    value = intern(value)
+                setattr(resp, field, value)
+        return resp
+
+    def get(self, field, default=None):
+        return getattr(self, field, default)
+
+    def items(self):
+        for field in RESPONSE_FIELDS:
+            if hasattr(self, field):
+                yield field, getattr(self, field)
+
+    def __eq__(self, other):
+        if not isinstance(other, MappingResponse):
+            return NotImplemented
+        return tuple(self.items()) == tuple(other.items())
+
+    def __hash__(self):
+        return hash(tuple(self.items()))
+
+
+class MappingResult:
+    __slots__ = ("task", "response")
+
+    def __init__(self, task, response=None):
+        self.task = task
+        self.response = response
+
+    def __eq__(self, other):
+        if not isinstance(other, MappingResult):
+            return NotImplemented
+        return self.task == other.task and self.response == other.response
+
+    def __hash__(self):
+        return hash((self.task, self.response))
@@ -0,0 +1,91 @@
+import heapq
+import threading
+import time
+
+from config import logger, settings
+
+
+class Scheduler:
+
+    def __init__(self, tasks, priority=None, deadline=None):
+        self.deadline = deadline
+        self.lock = threading.Lock()
+        self.heap = []
+        self.keys = set()
+        for seq, (task, records) in enumerate(tasks):
+            rank = priority(task, records) if priority else ()
+            self.heap.append((rank, seq, task))
+            self.keys.add(task.key)
+        heapq.heapify(self.heap)
+        self.completed = set()
+
+    def next_batch(self, size):
+        with self.lock:
+            if self.expired():
+                return []
+
+            size = min(size, len(self.heap))
+            return [heapq.heappop(self.heap)[2] for _ in range(size)]
+
+    def complete(self, tasks):
+        with self.lock:
+            self.completed.update(task.key for task in tasks)
+
+    def unfinished_keys(self):
+        with self.lock:
+            return self.keys - self.completed
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def remaining(self):
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+
+def build_priority(previous_isins=None):
+    criteria = [c for c in settings.MAPPING_PRIORITY if c]
+    if not criteria:
+        return None
+
+    exchange_rank = {
+        name: rank for rank, name in enumerate(settings.MAPPING_PRIORITY_EXCHANGES)
+    }
+    weight_column = settings.MAPPING_PRIORITY_WEIGHT_COLUMN
+
+    def weight(records):
+        values = []
+        for record in records:
+            try:
+                values.append(float(record.get(weight_column) or 0))
+            except (TypeError, ValueError):
+                continue
+        return max(values, default=0.0)
+
+    keys = []
+    for criterion in criteria:
+        if criterion == "new":
+            known = previous_isins or set()
+            keys.append(lambda task, records: task.isin in known)
+        elif criterion == "weight":
+            keys.append(lambda task, records: -weight(records))
+        elif criterion == "exchange":
+            keys.append(
+                lambda task, records: exchange_rank.get(
+                    task.exchange, len(exchange_rank)
+                )
+            )
+        else:
+            logger.warning(f"Ignoring unknown mapping priority {criterion}")
+
+    def priority(task, records):
+        return tuple(key(task, records) for key in keys)
+
+    return priority
+
+
+def mapping_deadline():
+    if settings.MAPPING_DEADLINE_SECONDS <= 0:
+        return None
+    return time.monotonic() + settings.MAPPING_DEADLINE_SECONDS
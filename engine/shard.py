@@ -0,0 +1,79 @@
+import os
+import pickle
+import zlib
+
+from config import logger, settings
+
+
+def shard_of(isin, count):
+    # crc32 is stable across processes, unlike the salted built-in hash()
+    return zlib.crc32(str(isin).replace(" ", "").strip().encode()) % count
+
+
+def shard_run_id():
+    if not settings.SHARD_RUN_ID:
+        raise ValueError(
+            "SHARD_RUN_ID is required for shard and merge runs, "
+            "use the same value for every pod of a run (e.g. the Job UID)"
+        )
+    return settings.SHARD_RUN_ID
+
+
+def shard_path(index, count, run_id):
+    return os.path.join(
+        settings.SHARD_STAGING_DIR,
+        f"shard-{run_id}-{index:04d}-of-{count:04d}.pkl",
+    )
+
+
+def save_shard(index, count, passes):
+    run_id = shard_run_id()
+    os.makedirs(settings.SHARD_STAGING_DIR, exist_ok=True)
+    path = shard_path(index, count, run_id)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(
+            {"run_id": run_id, "index": index, "count": count, **passes},
+            f,
+            protocol=pickle.HIGHEST_PROTOCOL,
+        )
+
+    os.replace(tmp_path, path)
+    logger.info(f"Saved shard {index + 1}/{count} of run {run_id} to {path}")
+    return path
+
+
+def load_shards(count):
+    run_id = shard_run_id()
+    missing = [
+        i for i in range(count) if not os.path.exists(shard_path(i, count, run_id))
+    ]
+    if missing:
+        raise FileNotFoundError(
+            f"Missing staging files for shards {missing} of run {run_id} "
+            f"in {settings.SHARD_STAGING_DIR}"
+        )
+
+    for index in range(count):
+        path = shard_path(index, count, run_id)
+        with open(path, "rb") as f:
+            logger.info(f"Loading shard {index + 1}/{count} from {path}")
+            passes = pickle.load(f)
+
+        stamp = (passes.get("run_id"), passes.get("index"), passes.get("count"))
+        if stamp != (run_id, index, count):
+            raise ValueError(
+                f"Staging file {path} was written by run {stamp[0]} "
+                f"as shard {stamp[1]} of {stamp[2]}, expected run {run_id}"
+            )
+        yield passes
+
+
+def remove_shards(count):
+    run_id = shard_run_id()
+    for index in range(count):
+        path = shard_path(index, count, run_id)
+        if os.path.exists(path):
+            os.remove(path)
+
+    logger.info(f"Removed {count} staging files of run {run_id}")
@@ -0,0 +1,302 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from config import logger, settings
+
+# Reference data sent once to each worker by its initializer, never per task
+_worker_refs = None
+
+
+class ReferenceData:
+    __slots__ = ("exchanges", "eod_tickers", "isin_eod_tickers_map")
+
+    def __init__(self, exchanges, eod_tickers, isin_eod_tickers_map):
+        self.exchanges = exchanges
+        self.eod_tickers = eod_tickers
+        self.isin_eod_tickers_map = isin_eod_tickers_map
+
+    def get_eod_ticker_by_isin(self, isin):
+        return self.isin_eod_tickers_map.get(isin, [])
+
+
+def generate_row_tickers(row, refs):
+    # The EOD exchange index is scoped to the row so output never depends on
+    # which rows were processed before it
+    eod_exch_index = {}
+    updates = {}
+    for func, comp in [
+        (generate_eod_ticker, False),
+        (generate_eod_ticker, True),
+        (generate_yahoo_ticker, False),
+        (generate_yahoo_ticker, True),
+    ]:
+        resp = func(row, refs, eod_exch_index, comp=comp)
+        if not resp:
+            continue
+
+        for k, v in resp.items():
+            if k not in row and k not in updates:
+                updates[k] = v
+
+    resp = generate_openfigi_ticker(row, refs)
+    if resp:
+        for k, v in resp.items():
+            if k not in row and k not in updates:
+                updates[k] = v
+
+    return updates
+
+
+def generate_tickers(rows, refs, processes=None, chunk_size=None):
+    processes = processes or settings.TICKER_PROCESS_COUNT
+    chunk_size = chunk_size or settings.TICKER_CHUNK_SIZE
+    if processes <= 1 or len(rows) <= chunk_size:
+        for idx, row in enumerate(rows):
+            logger.debug(f"Generating tickers for row {idx}")
+            row.update(generate_row_tickers(row, refs))
+        return rows
+
+    chunks = [rows[i: i + chunk_size] for i in range(0, len(rows), chunk_size)]
+    logger.info(
+        f"Generating tickers for {len(rows)} rows in {len(chunks)} chunks "
+        f"over {processes} processes"
+    )
+    # Forking is unsafe once the service, proxy and refresher threads are running
+    start_method = (
+        "forkserver"
+        if "forkserver" in multiprocessing.get_all_start_methods()
+        else "spawn"
+    )
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        mp_context=multiprocessing.get_context(start_method),
+        initializer=_init_worker,
+        initargs=(refs,),
+    ) as executor:
+        for chunk, updates in zip(chunks, executor.map(_generate_chunk, chunks)):
+            for row, update in zip(chunk, updates):
+                row.update(update)
+
+    return rows
+
+
+def _init_worker(refs):
+    global _worker_refs
+    _worker_refs = refs
+
+
+def _generate_chunk(rows):
+    return [generate_row_tickers(row, _worker_refs) for row in rows]
+
+
+def generate_eod_ticker(row, refs, eod_exch_index, comp=False):
+    if "exchCode" not in row:
+        return None
+
+    if row["ishares_exchange_name"] not in refs.exchanges:
+        return None
+
+    result = []
+
+    for exch in refs.exchanges[row["ishares_exchange_name"]]:
+        if exch["bbg_exch"] in row["exchCode"]:
+            exchange = exch
+            break
+        elif exch["bbg_exch_comp"] in row["exchCode"]:
+            exchange = exch
+            break
+
+    if comp:
+        _exchcode = exchange["ext2_exch_comp"]
+    else:
+        _exchcode = exchange["eod"]
+
+    if not _exchcode:
+        return None
+
+    if "," in _exchcode:
+        _exchcode = _exchcode.replace(" ", "").split(",")
+    else:
+        _exchcode = [_exchcode]
+
+    for eod_exchcode in _exchcode:
+        ticker = str(row["exchange_ticker"])
+        securitydesc = str(row["securityDescription"])
+        if "/" in securitydesc and "." not in ticker:
+            base = __base = securitydesc
+            base = base.replace("/", "-")
+
+            for _ in [".R", ".E"]:
+                if _ in base:
+                    base = base.replace(_, "")
+
+            base = f"{base}.{eod_exchcode}"
+            result.append(base)
+        else:
+            base = __base = ticker
+
+            if eod_exchcode == "HK":
+                if base.isdigit():
+                    if len(base) < 4:
+                        base = "".join(["0" for _ in range(4 - len(base))]) + base
+
+            elif eod_exchcode in ["KO", "KQ", "SHG", "SHE"]:
+                if base.isdigit():
+                    if len(base) < 6:
+                        base = "".join(["0" for _ in range(6 - len(base))]) + base
+
+            for _ in [".R", ".E"]:
+                if _ in base:
+                    base = base.replace(_, "")
+
+            if base[-1] == ".":
+                base = base.replace(".", "")
+            else:
+                base = base.replace(".", "-")
+
+            base = base.replace("*", "")
+            if " " in base:
+                base = base.replace(" ", "-")
+
+            base = f"{base}.{eod_exchcode}"
+            result.append(base)
+
+    if len(result) == 0:
+        return None
+
+    for i in result:
+        if i in refs.eod_tickers:
+            if "." in i:
+                exch = i.split(".")[1]
+                eod_exch_index[__base] = _exchcode.index(exch)
+
+            if comp:
+                return {"ext2_comp_ticker": i}
+            else:
+                return {"EOD Ticker": i}
+        else:
+            tickers = refs.get_eod_ticker_by_isin(
+                row["isin"].replace(" ", "").strip()
+            )
+            if len(tickers) > 0:
+                for _ in _exchcode:
+                    for t in tickers:
+                        if _ in t:
+                            if comp:
+                                return {"ext2_comp_ticker": t}
+                            else:
+                                return {"EOD Ticker": t}
+
+
+def generate_yahoo_ticker(row, refs, eod_exch_index, comp=False):
+    if "exchCode" not in row:
+        return None
+
+    if row["ishares_exchange_name"] not in refs.exchanges:
+        return None
+
+    for exch in refs.exchanges[row["ishares_exchange_name"]]:
+        if exch["bbg_exch"] in row["exchCode"]:
+            exchange = exch
+            break
+        elif exch["bbg_exch_comp"] in row["exchCode"]:
+            exchange = exch
+            break
+
+    if comp:
+        yahoo_exchcode = exchange["ext3_exch_comp"]
+    else:
+        yahoo_exchcode = exchange["yahoo"]
+
+    if not yahoo_exchcode:
+        return None
+
+    ticker = str(row["exchange_ticker"])
+    securitydesc = str(row["securityDescription"])
+
+    if "," in yahoo_exchcode:
+        yahoo_exchcode = yahoo_exchcode.replace(" ", "").split(",")
+
+        if ticker in eod_exch_index:
+            indx = eod_exch_index[ticker]
+            yahoo_exchcode = yahoo_exchcode[indx]
+        elif securitydesc in eod_exch_index:
+            indx = eod_exch_index[securitydesc]
+            yahoo_exchcode = yahoo_exchcode[indx]
+        else:
+            yahoo_exchcode = yahoo_exchcode[0]
+
+    if "/" in securitydesc and "." not in ticker:
+        base = securitydesc
+        base = base.replace("/", "-")
+        if yahoo_exchcode != "US":
+            base = f"{base}.{yahoo_exchcode}"
+
+        if comp:
+            return {"ext3_comp_ticker": base}
+        else:
+            return {"Yahoo Ticker": base}
+    else:
+        base = ticker
+        if yahoo_exchcode == "HK":
+            if base.isdigit():
+                if len(base) < 4:
+                    base = "".join(["0" for _ in range(4 - len(base))]) + base
+
+        elif yahoo_exchcode == "KO" or yahoo_exchcode == "SHG":
+            if base.isdigit():
+                if len(base) < 6:
+                    base = "".join(["0" for _ in range(6 - len(base))]) + base
+
+        if base[-1] == ".":
+            base = base.replace(".", "")
+        else:
+            base = base.replace(".", "-")
+
+        base = base.replace("*", "")
+        if " " in base:
+            if base[-2] == " ":
+                base = base.replace(" ", "-")
+            elif base[-3] == " ":
+                base = base[:-3]
+
+        if yahoo_exchcode != "US":
+            base = f"{base}.{yahoo_exchcode}"
+
+        if comp:
+            return {"ext3_comp_ticker": base}
+        else:
+            return {"Yahoo Ticker": base}
+
+
+def generate_openfigi_ticker(row, refs):
+    if "ticker" not in row:
+        return False
+
+    exch = row["exchCode"]
+    if " " in exch:
+        exch = exch.split(" ")[0]
+
+    news = row["ticker"] + ":" + exch
+    ticker = row["ticker"] + " " + exch + " " + row["marketSector"]
+    ticker_comp = ""
+
+    if row["ishares_exchange_name"] in refs.exchanges:
+        for exch in refs.exchanges[row["ishares_exchange_name"]]:
+            if (
+                exch["bbg_exch"] in row["exchCode"]
+                or exch["bbg_exch_comp"] in row["exchCode"]
+            ):
+                ticker_comp = (
+                    row["ticker"]
+                    + " "
+                    + exch["bbg_exch_comp"]
+                    + " "
+                    + row["marketSector"]
+                )
+
+    return {
+        "OPENFIGI News Ticker": news,
+        "OPENFIGI Ticker": ticker,
+        "OPENFIGI COMP Ticker": ticker_comp,
+    }
@@ -1,25 +1,48 @@
 from config import logger, settings
-from database.helper import init_db_instance
 from engine.core import Core
-from transformer import Transformer
+from engine.pipeline import store_output
 
 
 def main():
+    if settings.RUN_MODE == "service":
+        from service import serve
+
+        serve()
+        return
+
     logger.info("Initializing Scraper Engine")
     core = Core()
-    dataframe = core.run()
-    logger.info("Transforming Data")
-    agent = Transformer(dataframe)
-    transformed_dataframe = agent.transform()
+    if settings.RUN_MODE == "shard":
+        logger.info(
+            f"Running shard {settings.SHARD_INDEX + 1}/{settings.SHARD_COUNT}"
+        )
+        core.run_shard(settings.SHARD_INDEX, settings.SHARD_COUNT)
+        logger.info("Shard completed successfully")
+        return
+    elif settings.RUN_MODE == "merge":
+        logger.info(f"Merging {settings.SHARD_COUNT} shards")
+        dataframe = core.run_merge(settings.SHARD_COUNT)
+    else:
+        dataframe = core.run()
+
+    isins = None
+    if settings.ISHARES_CHANGED_SINCE is not None:
+        isins = core.ishares["isin"].unique().tolist()
+        logger.info(
+            f"Incremental run over {len(isins)} ISINs changed since "
+            f"{settings.ISHARES_CHANGED_SINCE}"
+        )
+
+    transformed_dataframe = store_output(
+        dataframe, isins, carry_forward=core.unfinished_keys
+    )
     if transformed_dataframe.empty:
-        logger.warning("Transformed dataframe is empty")
         return
 
-    logger.info(f"\n\n{transformed_dataframe}")
-    logger.info("Preparing Database Inserter")
-    conn = init_db_instance()
-    logger.info(f"Inserting Data into {settings.OUTPUT_TABLE}")
-    conn.insert_table(transformed_dataframe, settings.OUTPUT_TABLE)
+    # Staging files are the only copy of the shard results until the write lands
+    if settings.RUN_MODE == "merge":
+        core.cleanup_shards(settings.SHARD_COUNT)
+
     logger.info("Application completed successfully")
     return
 
@@ -0,0 +1 @@
+from service.server import serve  # noqa: F401
@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import logger, settings
+from engine.core import Core
+from engine.lookup import Lookup
+from engine.pipeline import store_output
+
+
+class Service:
+
+    REFRESH_INTERVAL = settings.SERVICE_REFRESH_INTERVAL
+
+    def __init__(self):
+        self.core = Core()
+        self.lookup = Lookup(self.core)
+        self.lock = threading.Lock()
+        self.status = {
+            "running": False,
+            "reference_loaded_at": self.timenow(),
+            "last_run_started_at": None,
+            "last_run_finished_at": None,
+            "last_run_rows": None,
+            "last_run_error": None,
+        }
+        self.refresher = threading.Thread(
+            target=self._refresh_periodically, daemon=True
+        )
+        self.refresher.start()
+
+    def refresh(self, blocking=True):
+        # Reference data is never swapped under a running mapping
+        if not self.lock.acquire(blocking=blocking):
+            return False
+
+        try:
+            logger.info("Refreshing reference data")
+            self.core.load_reference_data()
+            self.status["reference_loaded_at"] = self.timenow()
+        finally:
+            self.lock.release()
+        return True
+
+    def trigger_run(self, isins=None, changed_since=None):
+        if not self.lock.acquire(blocking=False):
+            return False
+
+        self.status["running"] = True
+        self.status["last_run_started_at"] = self.timenow()
+        t = threading.Thread(
+            target=self._run, args=[isins, changed_since], daemon=True
+        )
+        t.start()
+        return True
+
+    def _run(self, isins, changed_since):
+        try:
+            if changed_since is None:
+                self.core.load_ishares()
+                ishares = self.core.ishares
+            else:
+                # Lookups keep resolving names and tickers from the full universe
+                ishares = self.core.fetch_ishares(changed_since)
+
+            if isins is not None:
+                ishares = ishares[ishares["isin"].isin(isins)]
+                logger.info(f"Partial run over {len(ishares)} ishares records")
+            elif changed_since is not None:
+                isins = ishares["isin"].unique().tolist()
+                logger.info(f"Incremental run over {len(isins)} changed ISINs")
+
+            dataframe = self.core.run(ishares)
+            transformed_dataframe = store_output(
+                dataframe, isins, carry_forward=self.core.unfinished_keys
+            )
+            self.status["last_run_rows"] = len(transformed_dataframe)
+            self.status["last_run_error"] = None
+        except Exception as e:
+            logger.error(f"Triggered run failed: {e}")
+            self.status["last_run_error"] = str(e)
+        finally:
+            self.status["running"] = False
+            self.status["last_run_finished_at"] = self.timenow()
+            self.lock.release()
+
+    def _refresh_periodically(self):
+        while self.REFRESH_INTERVAL > 0:
+            time.sleep(self.REFRESH_INTERVAL)
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"Scheduled reference refresh failed: {e}")
+
+    @staticmethod
+    def timenow():
+        return datetime.utcnow().isoformat()
+
+
+def make_handler(service):
+    class Handler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path == "/health":
+                return self._reply(200, service.status)
+            return self._reply(404, {"error": "not found"})
+
+        def do_POST(self):
+            try:
+                body = self._read_json()
+            except ValueError as e:
+                return self._reply(400, {"error": f"invalid JSON body: {e}"})
+
+            if not isinstance(body, dict):
+                return self._reply(400, {"error": "JSON body must be an object"})
+
+            try:
+                return self._post(body)
+            except Exception as e:
+                logger.error(f"Error handling POST {self.path}: {e}")
+                return self._reply(500, {"error": str(e)})
+
+        def _post(self, body):
+            if self.path == "/refresh":
+                if not service.refresh(blocking=False):
+                    return self._reply(409, {"error": "a run is in progress"})
+                return self._reply(200, service.status)
+
+            if self.path == "/lookup":
+                pairs = body.get("pairs", [])
+                if not isinstance(pairs, list):
+                    return self._reply(400, {"error": "pairs must be a list"})
+                try:
+                    rows = service.lookup.lookup(pairs)
+                except ValueError as e:
+                    return self._reply(400, {"error": str(e)})
+                return self._reply(200, {"rows": rows})
+
+            if self.path == "/run":
+                isins = body.get("isins")
+                if isins is not None and not isinstance(isins, list):
+                    return self._reply(400, {"error": "isins must be a list"})
+                try:
+                    changed_since = settings.datetime_cast(body.get("changed_since"))
+                except (TypeError, ValueError) as e:
+                    return self._reply(400, {"error": f"invalid changed_since: {e}"})
+                if not service.trigger_run(isins, changed_since):
+                    return self._reply(409, {"error": "a run is already in progress"})
+                return self._reply(202, service.status)
+
+            return self._reply(404, {"error": "not found"})
+
+        def _read_json(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            if not length:
+                return {}
+            return json.loads(self.rfile.read(length))
+
+        def _reply(self, status, payload):
+            data = json.dumps(payload, default=str).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logger.debug(f"{self.address_string()} - {format % args}")
+
+    return Handler
+
+
+def serve():
+    logger.info("Starting warm service")
+    service = Service()
+    server = ThreadingHTTPServer(
+        (settings.SERVICE_HOST, settings.SERVICE_PORT), make_handler(service)
+    )
+    logger.info(f"Listening on {settings.SERVICE_HOST}:{settings.SERVICE_PORT}")
+    server.serve_forever()